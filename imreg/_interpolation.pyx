@@ -3,68 +3,113 @@
 #cython: nonecheck=False
 #cython: wraparound=False
 
-cimport numpy as cnp
+from cython.parallel cimport prange
 
 from libc.math cimport ceil, floor
 
+# The sampling kernels release the GIL and distribute output rows over threads
+# (when compiled with OpenMP).
+
+
 def nearest(
-    cnp.ndarray[double, ndim=3,  mode="c"] warp,
-    cnp.ndarray[double, ndim=2,  mode="c"] image,
-    cnp.ndarray[double, ndim=2,  mode="c"] output
+    const double[:, :, ::1] warp,
+    const double[:, ::1] image,
+    double[:, ::1] output
     ):
     """ Computes a nearest neighbor sample """
 
-    cdef int out_rows = warp[0].shape[1]
-    cdef int out_cols = warp[0].shape[0]
+    cdef int out_rows = output.shape[0]
+    cdef int out_cols = output.shape[1]
 
-    cdef int img_rows = image.shape[1]
-    cdef int img_cols = image.shape[0]
+    cdef int img_rows = image.shape[0]
+    cdef int img_cols = image.shape[1]
 
-    cdef double rhat, chat
     cdef int r, c
 
-    for r in xrange(out_rows):
-       for c in xrange(out_cols):
-            output[r][c] = nearest_neighbour_interpolation(
-                                <double*> image.data,
-                                img_rows,
-                                img_cols,
-                                warp[0, r, c],
-                                warp[1, r, c],
-                                'C',
-                                0.0
-                                )
+    with nogil:
+        for r in prange(out_rows, schedule='static'):
+            for c in range(out_cols):
+                output[r, c] = nearest_neighbour_interpolation(
+                                    &image[0, 0],
+                                    img_rows,
+                                    img_cols,
+                                    warp[0, r, c],
+                                    warp[1, r, c],
+                                    'C',
+                                    0.0
+                                    )
     return 0
 
 
 def bilinear(
-    cnp.ndarray[double, ndim=3,  mode="c"] warp,
-    cnp.ndarray[double, ndim=2,  mode="c"] image,
-    cnp.ndarray[double, ndim=2,  mode="c"] output
+    const double[:, :, ::1] warp,
+    const double[:, ::1] image,
+    double[:, ::1] output
     ):
     """ Computes a bilinear sample """
 
-    cdef int out_rows = warp[0].shape[1]
-    cdef int out_cols = warp[0].shape[0]
+    cdef int out_rows = output.shape[0]
+    cdef int out_cols = output.shape[1]
 
-    cdef int img_rows = image.shape[1]
-    cdef int img_cols = image.shape[0]
+    cdef int img_rows = image.shape[0]
+    cdef int img_cols = image.shape[1]
 
-    cdef double rhat, chat
     cdef int r, c
 
+    with nogil:
+        for r in prange(out_rows, schedule='static'):
+            for c in range(out_cols):
+                output[r, c] = bilinear_interpolation(
+                                    &image[0, 0],
+                                    img_rows,
+                                    img_cols,
+                                    warp[0, r, c],
+                                    warp[1, r, c],
+                                    'C',
+                                    0.0
+                                    )
+    return 0
+
+
+def bilinear_transform(
+    const double[:, ::1] matrix,
+    const double[:, ::1] image,
+    double[:, ::1] output,
+    double row0,
+    double col0
+    ):
+    """
+    Computes a bilinear sample of a (homogenous) linear deformation, the
+    sampling coordinates are evaluated on-the-fly for the unit spaced output
+    grid with origin (row0, col0).
+    """
+
+    cdef int out_rows = output.shape[0]
+    cdef int out_cols = output.shape[1]
+
+    cdef int img_rows = image.shape[0]
+    cdef int img_cols = image.shape[1]
+
+    cdef double m00 = matrix[0, 0], m01 = matrix[0, 1], m02 = matrix[0, 2]
+    cdef double m10 = matrix[1, 0], m11 = matrix[1, 1], m12 = matrix[1, 2]
+
+    cdef double x, y
+    cdef int r, c
 
-    for r in xrange(out_rows):
-       for c in xrange(out_cols):
-            output[r][c] = bilinear_interpolation(
-                                <double*> image.data,
-                                img_rows,
-                                img_cols,
-                                warp[0, r, c],
-                                warp[1, r, c],
-                                'C',
-                                0.0
-                                )
+    with nogil:
+        for r in prange(out_rows, schedule='static'):
+            y = row0 + r
+            for c in range(out_cols):
+                x = col0 + c
+                output[r, c] = bilinear_interpolation(
+                                    &image[0, 0],
+                                    img_rows,
+                                    img_cols,
+                                    m10 * x + m11 * y + m12,
+                                    m00 * x + m01 * y + m02,
+                                    'C',
+                                    0.0
+                                    )
     return 0
 
 
@@ -72,14 +117,15 @@ def bilinear(
 #  - latest commit @ 4ff97da8b15c987b5eb5b2944395cff812715e0e
 
 
-cdef inline int round(double r):
+cdef inline int round(double r) nogil:
     return <int>((r + 0.5) if (r > 0.0) else (r - 0.5))
 
 
-cdef inline double nearest_neighbour_interpolation(double* image, int rows,
-                                                   int cols, double r,
-                                                   double c, char mode,
-                                                   double cval):
+cdef inline double nearest_neighbour_interpolation(const double* image,
+                                                   int rows, int cols,
+                                                   double r, double c,
+                                                   char mode,
+                                                   double cval) nogil:
     """Nearest neighbour interpolation at a given position in the image.
 
     Parameters
@@ -106,9 +152,9 @@ cdef inline double nearest_neighbour_interpolation(double* image, int rows,
                        mode, cval)
 
 
-cdef inline double bilinear_interpolation(double* image, int rows, int cols,
-                                          double r, double c, char mode,
-                                          double cval):
+cdef inline double bilinear_interpolation(const double* image, int rows,
+                                          int cols, double r, double c,
+                                          char mode, double cval) nogil:
     """Bilinear interpolation at a given position in the image.
 
     Parameters
@@ -130,7 +176,7 @@ cdef inline double bilinear_interpolation(double* image, int rows, int cols,
         Interpolated value.
 
     """
-    cdef double dr, dc
+    cdef double dr, dc, top, bottom
     cdef int minr, minc, maxr, maxc
 
     minr = <int>floor(r)
@@ -146,8 +192,8 @@ cdef inline double bilinear_interpolation(double* image, int rows, int cols,
     return (1 - dr) * top + dr * bottom
 
 
-cdef inline double get_pixel2d(double* image, int rows, int cols, int r, int c,
-                               char mode, double cval):
+cdef inline double get_pixel2d(const double* image, int rows, int cols, int r,
+                               int c, char mode, double cval) nogil:
     """Get a pixel from the image, taking wrapping mode into consideration.
 
     Parameters
@@ -178,7 +224,7 @@ cdef inline double get_pixel2d(double* image, int rows, int cols, int r, int c,
         return image[coord_map(rows, r, mode) * cols + coord_map(cols, c, mode)]
 
 
-cdef inline int coord_map(int dim, int coord, char mode):
+cdef inline int coord_map(int dim, int coord, char mode) nogil:
     """
     Wrap a coordinate, according to a given mode.
 
@@ -1,6 +1,10 @@
 """ A collection of image similarity metrics. """
 
 import collections
+import multiprocessing
+import os
+
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 from scipy import ndimage
@@ -9,16 +13,76 @@ from scipy import ndimage
 
 Method = collections.namedtuple('method', 'jacobian error update')
 
+# Precision of the (image sized) jacobians, single precision halves the memory
+# traffic of forming the (small) normal equations, which are solved in double
+# precision.
+
+JACOBIAN_DTYPE = np.float32
+
+# Number of pixels (jacobian rows) per block, blocks are assembled in parallel.
+
+JACOBIAN_BLOCK = 2 ** 16
+
+# Thread pool shared by the jacobian assembly, created on first use (and again
+# in a forked child, which does not inherit the pool's worker threads).
+
+_pool = None
+_poolPid = None
+
+
+def cpuCount():
+    """ Number of CPUs available to this process """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+def threadPool():
+    """ Returns the (lazily created) thread pool for the jacobian assembly """
+    global _pool, _poolPid
+    if _pool is None or _poolPid != os.getpid():
+        _pool = ThreadPool(cpuCount())
+        _poolPid = os.getpid()
+    return _pool
+
 
 def gradient(image, variance=0.1):
     """ Computes the image gradient """
     grad = np.gradient(image)
 
-    dIx = ndimage.gaussian_filter(grad[1], variance).flatten()
-    dIy = ndimage.gaussian_filter(grad[0], variance).flatten()
+    dIx = ndimage.gaussian_filter(grad[1], variance, output=JACOBIAN_DTYPE).ravel()
+    dIy = ndimage.gaussian_filter(grad[0], variance, output=JACOBIAN_DTYPE).ravel()
 
     return dIx, dIy
 
+
+def steepestDescent(dIx, dIy, dPx, dPy):
+    """
+    Computes the jacobian, (dPx * dIx) + (dPy * dIy).
+
+    Blocks of rows share no writes, so they are assembled across threads (NumPy
+    releases the GIL in the arithmetic).
+    """
+
+    J = np.empty(dPx.shape, dtype=JACOBIAN_DTYPE)
+
+    def assemble(rows):
+        np.multiply(dPx[rows], dIx[rows, np.newaxis], out=J[rows])
+        J[rows] += dPy[rows] * dIy[rows, np.newaxis]
+
+    blocks = [
+        slice(start, start + JACOBIAN_BLOCK)
+        for start in range(0, J.shape[0], JACOBIAN_BLOCK)
+        ]
+
+    if len(blocks) == 1:
+        assemble(blocks[0])
+    else:
+        threadPool().map(assemble, blocks)
+
+    return J
+
 # ==============================================================================
 # Forwards additive:
 # ==============================================================================
@@ -49,15 +113,12 @@ def forwardsAdditiveJacobian(image, template, model, p):
 
     dPx, dPy = model.jacobian(template.coords, p)
 
-    J = np.zeros_like(dPx)
-    for index in range(0, dPx.shape[1]):
-        J[:, index] = (dPx[:, index] * dIx) + (dPy[:, index] * dIy)
-    return J
+    return steepestDescent(dIx, dIy, dPx, dPy)
 
 
-def forwardsAdditiveError(image, template):
+def forwardsAdditiveError(image, template, out=None):
     """ Compute the forwards additive error """
-    return (template - image).flatten()
+    return np.subtract(template, image, out=out).ravel()
 
 
 def forwardsAdditiveUpdate(p, deltaP, model=None):
@@ -77,9 +138,9 @@ forwardsAdditive = Method(
 # ==============================================================================
 
 
-def forwardsCompositionalError(image, template):
+def forwardsCompositionalError(image, template, out=None):
     """ Compute the forwards additive error """
-    return (template - image).flatten()
+    return np.subtract(template, image, out=out).ravel()
 
 
 def forwardsCompositionalUpdate(p, deltaP, tform):
@@ -124,15 +185,12 @@ def inverseCompositionalJacobian(image, template, model, p):
 
     dPx, dPy = model.jacobian(template.coords, p)
 
-    J = np.zeros_like(dPx)
-    for index in range(0, dPx.shape[1]):
-        J[:, index] = (dPx[:, index] * dIx) + (dPy[:, index] * dIy)
-    return J
+    return steepestDescent(dIx, dIy, dPx, dPy)
 
 
-def inverseCompositionalError(image, template):
+def inverseCompositionalError(image, template, out=None):
     """ Compute the inverse additive error """
-    return (image - template).flatten()
+    return np.subtract(image, template, out=out).ravel()
 
 
 def inverseCompositionalUpdate(p, deltaP, tform):
@@ -149,3 +207,8 @@ inverseCompositional = Method(
     inverseCompositionalUpdate
     )
 
+# Jacobians evaluated on the template (rather than the warped image), these
+# only depend on the model parameters.
+
+TEMPLATE_JACOBIANS = (inverseCompositionalJacobian,)
+
@@ -11,26 +11,79 @@ class Coordinates(object):
     ----------
     domain : nd-array
         Domain of the coordinate system.
+    shape : tuple
+        Shape of the coordinate grid.
+    regular : boolean
+        True for a unit spaced grid spanning the domain.
     tensor : nd-array
-        Grid coordinates.
+        Grid coordinates (evaluated lazily).
     homogenous : nd-array
         `Homogenous` coordinate system representation of grid coordinates.
+
+    Notes
+    -----
+    Coordinates are stored as planes (structure of arrays): `homogenous` is
+    (3, N) with rows (x, y, 1), and the model transforms write (2,) + shape
+    warps with (row, column) planes. The matrix products and jacobians stream
+    along the contiguous pixel axis and the samplers read each plane along an
+    output row, so a pixel-major (N, 3) layout would only add strided reads.
     """
 
     def __init__(self, domain, tensor=None):
 
         self.domain = domain
+        self.regular = tensor is None
+        self._tensor = tensor
 
         if tensor is None:
-            self.tensor = np.mgrid[domain[0]:domain[1], domain[2]:domain[3]]
+            rows = np.arange(domain[0], domain[1])
+            cols = np.arange(domain[2], domain[3])
+            self.shape = (rows.size, cols.size)
+
+            # Fill the homogenous rows in-place, avoiding a dense grid.
+            self.homogenous = np.empty((3, rows.size * cols.size))
+            self.homogenous[0].reshape(self.shape)[:] = cols
+            self.homogenous[1].reshape(self.shape)[:] = rows[:, np.newaxis]
         else:
-            self.tensor = tensor
+            self.shape = tensor[0].shape
+
+            self.homogenous = np.empty((3, tensor[0].size))
+            self.homogenous[0] = tensor[1].ravel()
+            self.homogenous[1] = tensor[0].ravel()
 
-        self.homogenous = np.zeros((3, self.tensor[0].size))
-        self.homogenous[0] = self.tensor[1].flatten()
-        self.homogenous[1] = self.tensor[0].flatten()
         self.homogenous[2] = 1.0
 
+    @property
+    def tensor(self):
+        """ Grid coordinates, evaluated on demand. """
+        if self._tensor is None:
+            self._tensor = np.mgrid[
+                self.domain[0]:self.domain[1],
+                self.domain[2]:self.domain[3]
+                ]
+        return self._tensor
+
+    def subsample(self, spacing):
+        """
+        Coarse grid coordinates, sampled (at most) every `spacing` pixels. The
+        first and last rows and columns of the grid are always retained.
+        """
+
+        rows = self.homogenous[1].reshape(self.shape)[:, 0]
+        cols = self.homogenous[0].reshape(self.shape)[0, :]
+
+        rows = np.linspace(
+            rows[0], rows[-1], int(np.ceil((rows.size - 1) / float(spacing))) + 1
+            )
+        cols = np.linspace(
+            cols[0], cols[-1], int(np.ceil((cols.size - 1) / float(spacing))) + 1
+            )
+
+        return Coordinates(
+            self.domain,
+            np.array(np.meshgrid(rows, cols, indexing='ij'))
+            )
+
     @staticmethod
     def fromTensor(tensor):
         domain = [tensor[1].min(), tensor[1].max(), tensor[0].min(), tensor[0].max()]
@@ -55,6 +108,9 @@ class Shift(object):
     Unifying Framework. Int. J. Comput. Vision 56, 3 (February 2004).
     """
 
+    # The warp is matrix(p)[:2] applied to the homogenous coordinates.
+    linear = True
+
     def __call__(self, p, coords):
         return Coordinates.fromTensor(self.transform(p, coords))
 
@@ -72,18 +128,20 @@ class Shift(object):
     def vector(self, H):
         return H[0:2, 2]
 
-    def transform(self, p, coords):
+    def transform(self, p, coords, out=None):
         """
         A "shift" transformation of coordinates.
+
+        The (row, column) coordinates are written to `out`, a C-contiguous
+        array of shape (2,) + coords.shape, when it is given.
         """
 
-        displacement = np.dot(self.matrix(p), coords.homogenous)
+        if out is None:
+            out = np.empty((2,) + coords.shape)
 
-        shape = coords.tensor[0].shape
+        np.dot(self.matrix(p)[1::-1], coords.homogenous, out=out.reshape(2, -1))
 
-        return np.array(
-            [displacement[1].reshape(shape), displacement[0].reshape(shape)]
-            )
+        return out
 
     def jacobian(self, coords, p=None):
         """
@@ -91,8 +149,8 @@ class Shift(object):
         coordinates.
         """
 
-        dx = np.zeros((coords.tensor[0].size, 2))
-        dy = np.zeros((coords.tensor[0].size, 2))
+        dx = np.zeros((coords.homogenous.shape[1], 2))
+        dy = np.zeros((coords.homogenous.shape[1], 2))
 
         dx[:, 0] = 1.0
         dy[:, 1] = 1.0
@@ -113,6 +171,9 @@ class Affine(object):
     Unifying Framework. Int. J. Comput. Vision 56, 3 (February 2004).
     """
 
+    # The warp is matrix(p)[:2] applied to the homogenous coordinates.
+    linear = True
+
     def __call__(self, p, coords):
         return Coordinates.fromTensor(self.transform(p, coords))
 
@@ -137,17 +198,20 @@ class Affine(object):
              H[1, 2],
              ])
 
-    def transform(self, p, coords):
+    def transform(self, p, coords, out=None):
         """
         An "affine" transformation of coordinates.
+
+        The (row, column) coordinates are written to `out`, a C-contiguous
+        array of shape (2,) + coords.shape, when it is given.
         """
 
-        displacement = np.dot(self.matrix(p), coords.homogenous)
-        shape = coords.tensor[0].shape
+        if out is None:
+            out = np.empty((2,) + coords.shape)
 
-        return np.array(
-            [displacement[1].reshape(shape), displacement[0].reshape(shape)]
-            )
+        np.dot(self.matrix(p)[1::-1], coords.homogenous, out=out.reshape(2, -1))
+
+        return out
 
     def jacobian(self, coords, p=None):
         """"
@@ -184,6 +248,9 @@ class Homography(object):
     Unifying Framework. Int. J. Comput. Vision 56, 3 (February 2004).
     """
 
+    # The warp is matrix(p)[:2] applied to the homogenous coordinates.
+    linear = True
+
     def __call__(self, p, coords):
         return Coordinates.fromTensor(self.transform(p, coords))
 
@@ -210,16 +277,20 @@ class Homography(object):
              H[1, 2],
              ])
 
-    def transform(self, p, coords):
+    def transform(self, p, coords, out=None):
         """
         An "projective" transformation of coordinates.
+
+        The (row, column) coordinates are written to `out`, a C-contiguous
+        array of shape (2,) + coords.shape, when it is given.
         """
 
-        displacement = np.dot(self.matrix(p), coords.homogenous)
-        shape = coords.tensor[0].shape
-        return np.array(
-            [displacement[1].reshape(shape), displacement[0].reshape(shape)]
-            )
+        if out is None:
+            out = np.empty((2,) + coords.shape)
+
+        np.dot(self.matrix(p)[1::-1], coords.homogenous, out=out.reshape(2, -1))
+
+        return out
 
     def jacobian(self, coords, p):
         """"
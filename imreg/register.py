@@ -1,6 +1,8 @@
 """ A top level registration module """
 
 import numpy as np
+from scipy import optimize
+from scipy.linalg import blas, lapack
 
 import logging
 
@@ -13,9 +15,9 @@ log = logging.getLogger('imreg.register')
 
 REGISTRATION_STEP = """
 ================================================================================
-iteration  : {0}
-parameters : {1}
-error      : {2}
+iteration  : %d
+parameters : %s
+error      : %g
 ================================================================================
 """
 
@@ -25,6 +27,31 @@ Optimization break, maximum number of bad iterations exceeded.
 ================================================================================
 """
 
+LEAST_SQUARES_RESULT = """
+================================================================================
+evaluations: %d
+parameters : %s
+error      : %g
+status     : %s
+================================================================================
+"""
+
+# Samplers paired with a counterpart that evaluates the (linear) deformation
+# matrix on-the-fly, rather than sampling a precomputed warp.
+FUSED_SAMPLERS = {
+    sampler.bilinear: sampler.bilinearTransform,
+    }
+
+
+def linearWeights(nodes, points):
+    """
+    Computes the (points x nodes) matrix that linearly interpolates values
+    sampled at the (increasing) nodes to the points.
+    """
+    return np.array(
+        [np.interp(points, nodes, weight) for weight in np.eye(nodes.size)]
+        ).T
+
 
 class RegisterData(object):
     """
@@ -98,25 +125,42 @@ class Register(object):
     ----------
     model: class
         A `deformation` model class definition.
+    gridSpacing: int
+        Spacing (in pixels) of the grid the deformation is evaluated on,
+        before it is linearly interpolated to every template pixel. This is
+        exact for the shift, affine and projective models, and reduces the
+        cost of the warp for models that are expensive to evaluate. The
+        interpolation is applied as dense matrix products, costing about
+        H * W * (W / gridSpacing) per iteration for an (H x W) template. For
+        the built-in models it is only faster than evaluating the warp
+        directly from a spacing of about 32 pixels (on a 1024 x 1024 grid).
     """
 
     MAX_ITER = 200
     MAX_BAD = 5
+    STEP_TOLERANCE = 1e-4
+
+    # Relative step tolerance of the MINPACK solver (see `leastSquares`), which
+    # stops once the update norm falls below LEAST_SQUARES_XTOL times the
+    # parameter norm. Unlike STEP_TOLERANCE (an absolute threshold on the
+    # squared update norm) it is scale invariant.
+    LEAST_SQUARES_XTOL = 1e-6
 
-    def __deltaP(self, J, e, alpha, p=None):
+    def __init__(self, gridSpacing=1):
+        self.gridSpacing = gridSpacing
+
+    def __deltaP(self, H, g, alpha):
         """
         Computes the parameter update.
 
         Parameters
         ----------
-        J: nd-array
-            The (dE/dP) the relationship between image differences and model
-            parameters.
-        e: float
-            The evaluated similarity metric.
+        H: nd-array
+           The approximate Hessian, J'J (only the lower triangle is used).
+        g: nd-array
+           The gradient, J'e.
         alpha: float
             A dampening factor.
-        p: nd-array or list of floats, optional
 
         Returns
         -------
@@ -124,29 +168,41 @@ class Register(object):
            The parameter update vector.
         """
 
-        H = np.dot(J.T, J)
+        # Marquardt dampening, scales the diagonal of the (symmetric
+        # positive-definite) approximate Hessian. The Hessian is copied as it
+        # is reused while retrying rejected steps.
+        H = np.array(H, dtype=np.float64, order='F')
+        H.flat[::H.shape[0] + 1] *= (1.0 + alpha)
+
+        # The Hessian is small, so LAPACK is called directly to avoid the
+        # overhead of the scipy.linalg wrappers.
+        c, info = lapack.dpotrf(H, lower=1, overwrite_a=1)
+        if info != 0:
+            raise np.linalg.LinAlgError(
+                'Hessian is not positive-definite (dpotrf info={0})'.format(info)
+                )
 
-        H += np.diag(alpha * np.diagonal(H))
+        deltaP, info = lapack.dpotrs(c, g, lower=1)
 
-        return np.dot(np.linalg.inv(H), np.dot(J.T, e))
+        return deltaP
 
-    def __dampening(self, alpha, decreasing):
+    def __dampening(self, exponent, decreasing):
         """
-        Computes the adjusted dampening factor.
+        Computes the adjusted dampening exponent.
 
         Parameters
         ----------
-        alpha: float
-            The current dampening factor.
+        exponent: int
+            The current (base 10) exponent of the dampening factor.
         decreasing: boolean
             Conditional on the decreasing error function.
 
         Returns
         -------
-        alpha: float
-           The adjusted dampening factor.
+        exponent: int
+           The adjusted exponent, the dampening factor is scaled by a decade.
         """
-        return alpha / 10. if decreasing else alpha * 10.
+        return exponent - 1 if decreasing else exponent + 1
 
     def register(self,
             image,
@@ -174,23 +230,76 @@ class Register(object):
         p: list (or nd-array), optional.
             First guess at fitting parameters.
         alpha: float
-            The dampening factor.
+            The initial dampening factor.
         verbose: boolean
-            A debug flag for text status updates.
+            A debug flag for text status updates, which are otherwise logged
+            at the debug level.
 
         Returns
         -------
         step: optimization step.
             The best optimization step (after convergence).
         search: list (of optimization steps)
-            The set of optimization steps (good and bad)
+            The set of optimization steps (good and bad), holding the error
+            and decreasing state only (not the parameters).
         """
 
-        p = tform.identity if p is None else p
+        # The parameters are updated in-place, with the parameters of the best
+        # step held in a separate buffer.
+        p = np.array(tform.identity if p is None else p, dtype=np.float64)
+        bestP = p.copy()
         deltaP = np.zeros_like(p)
 
-        # Dampening factor.
+        # Dampening factor, adjusted by decades. Tracking the integer exponent
+        # avoids accumulating rounding error from repeated scaling.
         alpha = alpha if alpha is not None else 1e-4
+        dampening = 0
+
+        templateJacobian = method.jacobian in metric.TEMPLATE_JACOBIANS
+
+        # Normalisation of the fitting error.
+        errorScale = 1.0 / image.data.size
+
+        # Sampling the deformation matrix directly avoids the warp altogether,
+        # for models whose warp is the (first two rows of the) matrix applied
+        # to the homogenous coordinates.
+        fusedSampler = None
+        if (self.gridSpacing == 1 and template.coords.regular and
+                getattr(tform, 'linear', False)):
+            fusedSampler = FUSED_SAMPLERS.get(sampler)
+
+        # Work buffers, reused across iterations.
+        warpedImage = np.empty(template.coords.shape)
+        error = np.empty(template.data.shape)
+        absError = np.empty(template.data.size)
+
+        # The error in the precision of the jacobian, for forming J'e.
+        jacobianError = np.empty(template.data.size, dtype=metric.JACOBIAN_DTYPE)
+
+        if fusedSampler is None:
+            warp = np.empty((2,) + template.coords.shape)
+
+        if self.gridSpacing > 1:
+            # Coarse warp grid and the weights that interpolate it to the
+            # template grid.
+            coarseCoords = template.coords.subsample(self.gridSpacing)
+            coarseWarp = np.empty((2,) + coarseCoords.shape)
+
+            cols, rows = template.coords.xy
+            coarseCols, coarseRows = coarseCoords.xy
+
+            rowWeights = linearWeights(
+                coarseRows[::coarseCoords.shape[1]],
+                rows[::template.coords.shape[1]]
+                )
+            colWeights = linearWeights(
+                coarseCols[:coarseCoords.shape[1]],
+                cols[:template.coords.shape[1]]
+                ).T
+
+        # Status updates are logged as warnings when verbose, otherwise as debug
+        # messages, which are only formatted when the logger is enabled.
+        logLevel = logging.WARNING if verbose else logging.DEBUG
 
         # Variables used to implement a back-tracking algorithm.
         search = []
@@ -199,70 +308,202 @@ class Register(object):
 
         for itteration in range(0, self.MAX_ITER):
 
-            # Compute the transformed coordinates.
-            coords = tform(p, template.coords)
+            if fusedSampler is not None:
+                # Sample to the template frame, deforming on-the-fly.
+                fusedSampler(
+                    image.data,
+                    tform.matrix(p),
+                    template.coords,
+                    out=warpedImage
+                    )
+            else:
+                # Compute the transformed coordinates.
+                if self.gridSpacing > 1:
+                    tform.transform(p, coarseCoords, out=coarseWarp)
+                    for index in range(2):
+                        np.dot(
+                            np.dot(rowWeights, coarseWarp[index]),
+                            colWeights,
+                            out=warp[index]
+                            )
+                else:
+                    tform.transform(p, template.coords, out=warp)
 
-            # Sample to the template frame using the transformed coordinates.
-            warpedImage = sampler(image.data, coords.tensor)
+                # Sample to the template frame using the transformed
+                # coordinates.
+                sampler(image.data, warp, out=warpedImage)
 
             # Evaluate the error metric.
-            e = method.error(warpedImage, template.data)
+            e = method.error(warpedImage, template.data, out=error)
 
-            # Cache the optimization step.
+            # Cache the optimization step, the parameters are only copied once
+            # the step becomes the best step.
             searchStep = optStep(
-               error=np.abs(e).sum() / np.prod(image.data.shape),
-               p=p.copy(),
-               deltaP=deltaP.copy(),
+               error=np.abs(e, out=absError).sum() * errorScale,
+               p=p,
+               deltaP=deltaP,
                decreasing=True
                )
 
-            # Update the current best step.
-            bestStep = searchStep if bestStep is None else bestStep
-
-            if verbose:
-                log.warn(
-                    REGISTRATION_STEP.format(
-                        itteration,
-                        ' '.join('{0:3.2f}'.format(param) for param in searchStep.p),
-                        searchStep.error
-                        )
+            # Log a copy of the parameters, which are updated in place and may
+            # be formatted long after this step (e.g. by a MemoryHandler).
+            if log.isEnabledFor(logLevel):
+                log.log(
+                    logLevel,
+                    REGISTRATION_STEP,
+                    itteration,
+                    searchStep.p.copy(),
+                    searchStep.error
                     )
 
-            # Append the search step to the search.
-            search.append(searchStep)
-
-            if len(search) > 1:
+            # Append the search step to the search, without the parameter
+            # vectors.
+            search.append(optStep(error=searchStep.error, decreasing=True))
 
+            # Update the current best step.
+            if bestStep is None:
+                bestStep = searchStep
+                bestStep.p = bestP
+            else:
                 searchStep.decreasing = (searchStep.error < bestStep.error)
+                search[-1].decreasing = searchStep.decreasing
 
-                alpha = self.__dampening(alpha, searchStep.decreasing)
+                dampening = self.__dampening(dampening, searchStep.decreasing)
 
                 if searchStep.decreasing:
+                    np.copyto(bestP, p)
                     bestStep = searchStep
+                    bestStep.p = bestP
                 else:
                     badSteps += 1
                     if badSteps > self.MAX_BAD:
-                        if verbose:
-                            log.warn(REGISTRATION_STOP)
+                        log.log(logLevel, REGISTRATION_STOP)
                         break
 
                     # Restore the parameters from the previous best iteration.
-                    p = bestStep.p.copy()
+                    np.copyto(p, bestP)
 
             # Computes the derivative of the error with respect to model
-            # parameters.
+            # parameters. After a rejected step the parameters are restored,
+            # so jacobians evaluated on the template are unchanged and are
+            # reused along with the approximate Hessian.
+
+            if searchStep.decreasing or not templateJacobian:
+                J = method.jacobian(warpedImage, template, tform, p)
 
-            J = method.jacobian(warpedImage, template, tform, p)
+                # The lower triangle of J'J, as a symmetric rank-k update
+                # (half the work of a general matrix product), in the
+                # precision of the jacobian.
+                syrk = blas.get_blas_funcs('syrk', (J,))
+                H = syrk(1.0, J.T, lower=1)
 
             # Compute the parameter update vector.
-            deltaP = self.__deltaP(J, e, alpha, p)
+            np.copyto(jacobianError, e, casting='same_kind')
+            deltaP = self.__deltaP(
+                H,
+                np.dot(J.T, jacobianError),
+                alpha * 10.0 ** dampening
+                )
 
-            # Evaluate stopping condition:
-            if np.dot(deltaP.T, deltaP) < 1e-4:
+            # Evaluate stopping condition (squared norm of the update):
+            if deltaP.dot(deltaP) < self.STEP_TOLERANCE:
                 break
 
             # Update the estimated parameters.
-            p = method.update(p, deltaP, tform)
+            np.copyto(p, method.update(p, deltaP, tform))
 
         return bestStep, search
 
+    def leastSquares(self,
+            image,
+            template,
+            tform,
+            sampler=sampler.bilinear,
+            p=None,
+            verbose=False
+            ):
+        """
+        Computes the registration between the image and template, using the
+        MINPACK Levenberg-Marquardt solver (scipy.optimize.least_squares).
+
+        Only the forwards additive formulation can be expressed as a least
+        squares problem over the model parameters; the compositional methods
+        are solved with `register`. Convergence is controlled by
+        LEAST_SQUARES_XTOL and MAX_ITER (the maximum number of residual
+        evaluations).
+
+        Parameters
+        ----------
+        image: nd-array
+            The floating image.
+        template: nd-array
+            The target image.
+        tform: deformation (class)
+            The deformation model (shift, affine, projective)
+        p: list (or nd-array), optional.
+            First guess at fitting parameters.
+        verbose: boolean
+            A debug flag for text status updates, which are otherwise logged
+            at the debug level.
+
+        Returns
+        -------
+        step: optimization step.
+            The best optimization step (after convergence), the decreasing
+            state is not set.
+        search: list (of optimization steps)
+            Only holds the best optimization step.
+        """
+
+        p = np.array(tform.identity if p is None else p, dtype=np.float64)
+
+        # Work buffers, reused across evaluations.
+        warp = np.empty((2,) + template.coords.shape)
+        warpedImage = np.empty(template.coords.shape)
+        e = np.empty(template.data.shape)
+
+        # Parameters of the current warped image.
+        warpedP = np.empty_like(p)
+        warpedP.fill(np.nan)
+
+        def residual(p):
+            tform.transform(p, template.coords, out=warp)
+            sampler(image.data, warp, out=warpedImage)
+            np.copyto(warpedP, p)
+            return metric.forwardsAdditiveError(
+                warpedImage,
+                template.data,
+                out=e
+                )
+
+        def jacobian(p):
+            if not np.array_equal(p, warpedP):
+                residual(p)
+            # The error is (template - warped), hence the negated jacobian.
+            J = metric.forwardsAdditiveJacobian(warpedImage, template, tform, p)
+            return np.negative(J, out=J)
+
+        result = optimize.least_squares(
+            residual,
+            p,
+            jac=jacobian,
+            method='lm',
+            xtol=self.LEAST_SQUARES_XTOL,
+            max_nfev=self.MAX_ITER
+            )
+
+        step = optStep(
+            error=np.abs(result.fun).sum() / image.data.size,
+            p=result.x
+            )
+
+        log.log(
+            logging.WARNING if verbose else logging.DEBUG,
+            LEAST_SQUARES_RESULT,
+            result.nfev,
+            step.p,
+            step.error,
+            result.message
+            )
+
+        return step, [step]
@@ -5,7 +5,7 @@ import scipy.ndimage as nd
 import imreg.interpolation as interpolation
 
 
-def nearest(image, warp):
+def nearest(image, warp, out=None):
     """
     Nearest-neighbour interpolation.
 
@@ -14,26 +14,29 @@ def nearest(image, warp):
         array: nd-array
             Input array for sampling.
         warp: nd-array
-            Deformation coordinates.
+            Deformation coordinates, (row, column) planes of shape (2, H, W).
+        out: nd-array, optional
+            Output array for the sample.
 
     Returns
     -------
         sample: nd-array
-           Sampled array data.
+           Sampled array data, of shape warp.shape[1:].
     """
 
-    result = np.zeros_like(warp[0], dtype=np.float64)
+    if out is None:
+        out = np.empty(warp.shape[1:])
 
     interpolation.nearest(
-        warp.astype(np.float64),
-        image.astype(np.float64),
-        result
+        np.ascontiguousarray(warp, dtype=np.float64),
+        np.ascontiguousarray(image, dtype=np.float64),
+        out
         )
 
-    return result
+    return out
 
 
-def bilinear(image, warp):
+def bilinear(image, warp, out=None):
     """
     Bilinear interpolation.
 
@@ -42,26 +45,65 @@ def bilinear(image, warp):
         array: nd-array
             Input array for sampling.
         warp: nd-array
-            Deformation coordinates.
+            Deformation coordinates, (row, column) planes of shape (2, H, W).
+        out: nd-array, optional
+            Output array for the sample.
 
     Returns
     -------
         sample: nd-array
-           Sampled array data.
+           Sampled array data, of shape warp.shape[1:].
     """
 
-    result = np.zeros_like(warp[0], dtype=np.float64)
+    if out is None:
+        out = np.empty(warp.shape[1:])
 
     interpolation.bilinear(
-        warp.astype(np.float64),
-        image.astype(np.float64),
-        result
+        np.ascontiguousarray(warp, dtype=np.float64),
+        np.ascontiguousarray(image, dtype=np.float64),
+        out
         )
 
-    return result
+    return out
 
 
-def spline(image, warp):
+def bilinearTransform(image, matrix, coords, out=None):
+    """
+    Bilinear interpolation of a linear deformation, evaluating the deformation
+    coordinates on-the-fly instead of sampling a precomputed warp.
+
+    Parameters
+    ----------
+        array: nd-array
+            Input array for sampling.
+        matrix: nd-array
+            The (3x3) deformation matrix, only the first two rows are used.
+        coords: Coordinates
+            Regular grid coordinates to deform.
+        out: nd-array, optional
+            Output array for the sample.
+
+    Returns
+    -------
+        sample: nd-array
+           Sampled array data, of shape coords.shape.
+    """
+
+    if out is None:
+        out = np.empty(coords.shape)
+
+    interpolation.bilinear_transform(
+        np.ascontiguousarray(matrix, dtype=np.float64),
+        np.ascontiguousarray(image, dtype=np.float64),
+        out,
+        coords.domain[0],
+        coords.domain[2]
+        )
+
+    return out
+
+
+def spline(image, warp, out=None):
     """
     Spline interpolation.
 
@@ -70,17 +112,20 @@ def spline(image, warp):
         array: nd-array
             Input array for sampling.
         warp: nd-array
-            Deformation coordinates.
+            Deformation coordinates, (row, column) planes of shape (2, H, W).
+        out: nd-array, optional
+            Output array for the sample.
 
     Returns
     -------
         sample: nd-array
-           Sampled array data.
+           Sampled array data, of shape warp.shape[1:].
     """
 
     return nd.map_coordinates(
         image,
         warp,
+        output=out,
         order=3,
         mode='nearest'
         )
@@ -1,11 +1,25 @@
 
 
+import sys
+
 from setuptools import setup, find_packages, Extension
 from Cython.Build import cythonize
 import numpy
 
+# The sampling kernels are parallelised with OpenMP, where it is available.
+if sys.platform == 'win32':
+    openmp_args = ['/openmp']
+    openmp_link_args = []
+elif sys.platform.startswith('linux'):
+    openmp_args = ['-fopenmp']
+    openmp_link_args = ['-fopenmp']
+else:
+    openmp_args = []
+    openmp_link_args = []
+
 extensions = [
-    Extension("interpolation", ["_interpolation.pyx"], include_dirs=[numpy.get_include()]), '.']
+    Extension("interpolation", ["_interpolation.pyx"], include_dirs=[numpy.get_include()],
+              extra_compile_args=openmp_args, extra_link_args=openmp_link_args), '.']
 
 setup(name='imreg',
       version='0.1.1',
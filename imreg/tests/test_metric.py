@@ -0,0 +1,71 @@
+import os
+import signal
+
+import numpy as np
+import pytest
+
+from imreg import metric
+
+
+def assemble():
+    """
+    Assembles a random jacobian, returning it with the column formula result.
+    """
+
+    rng = np.random.RandomState(0)
+
+    dIx = rng.rand(100).astype(metric.JACOBIAN_DTYPE)
+    dIy = rng.rand(100).astype(metric.JACOBIAN_DTYPE)
+    dPx = rng.rand(100, 6)
+    dPy = rng.rand(100, 6)
+
+    J = metric.steepestDescent(dIx, dIy, dPx, dPy)
+
+    expected = np.zeros_like(dPx)
+    for index in range(0, dPx.shape[1]):
+        expected[:, index] = (dPx[:, index] * dIx) + (dPy[:, index] * dIy)
+
+    return J, expected
+
+
+def test_steepest_descent(monkeypatch):
+    """
+    Tests the jacobian assembly, in blocks across threads, against the column
+    formula.
+    """
+
+    # Small blocks, so the rows are assembled on the thread pool.
+    monkeypatch.setattr(metric, 'JACOBIAN_BLOCK', 7)
+
+    J, expected = assemble()
+
+    assert J.dtype == metric.JACOBIAN_DTYPE
+    assert np.allclose(J, expected, rtol=1e-5)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_steepest_descent_fork(monkeypatch):
+    """
+    Tests the threaded jacobian assembly in a child forked after the thread
+    pool was created.
+    """
+
+    monkeypatch.setattr(metric, 'JACOBIAN_BLOCK', 7)
+
+    # Create the thread pool in the parent.
+    assemble()
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            # Fail, rather than hang, if the child waits on the parent's pool.
+            signal.alarm(10)
+            J, expected = assemble()
+            status = 0 if np.allclose(J, expected, rtol=1e-5) else 1
+        finally:
+            os._exit(status)
+
+    _pid, status = os.waitpid(pid, 0)
+
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
@@ -0,0 +1,26 @@
+import numpy as np
+
+from imreg import model
+
+
+def test_subsample():
+    """
+    Tests that subsampled coordinates keep the first and last rows and columns
+    of the grid.
+    """
+
+    coords = model.Coordinates([3, 100, 5, 145])
+
+    coarse = coords.subsample(16)
+
+    rows, cols = coarse.tensor
+
+    assert coarse.shape == (7, 10)
+    assert np.allclose(rows[:, 0], np.linspace(3, 99, 7))
+    assert np.allclose(cols[0, :], np.linspace(5, 144, 10))
+    assert np.all(np.diff(rows[:, 0]) <= 16)
+    assert np.all(np.diff(cols[0, :]) <= 16)
+
+    x, y = coarse.xy
+    assert np.allclose(x, cols.ravel())
+    assert np.allclose(y, rows.ravel())
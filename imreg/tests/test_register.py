@@ -1,3 +1,5 @@
+import logging
+
 import numpy as np
 
 import scipy.ndimage as nd
@@ -47,6 +49,21 @@ def pytest_generate_tests(metafunc):
                         )
                     )
 
+    if metafunc.function is test_least_squares:
+
+        for displacement in np.arange(-4., 5., 2.):
+            p = np.array([displacement, displacement])
+            template = deform(image, p, model.Shift())
+
+            metafunc.addcall(
+                id='dx={}, dy={}'.format(p[0], p[1]),
+                funcargs=dict(
+                    image=image,
+                    template=template,
+                    p=p
+                    )
+                )
+
     if metafunc.function is test_affine:
 
         for (method_name, method) in methods:
@@ -103,3 +120,81 @@ def test_affine(image, template, method, p):
             step.p,
             p
             )
+
+
+def test_least_squares(image, template, p):
+    """
+    Tests image registration using the MINPACK least squares solver.
+    """
+
+    shift = register.Register()
+
+    # Coerce the image data into RegisterData.
+    image = register.RegisterData(image)
+    template = register.RegisterData(template)
+
+    step, _search = shift.leastSquares(image, template, model.Shift())
+
+    assert np.allclose(p, step.p, atol=0.5), \
+        "Estimated p: {} not equal to p: {}".format(
+            step.p,
+            p
+            )
+
+
+def test_grid_spacing():
+    """
+    Tests that evaluating the warp on a coarse grid does not change the
+    registration.
+    """
+
+    image = nd.gaussian_filter(np.random.RandomState(0).rand(100, 140), 2.0)
+    p = np.array([0.01, -0.02, 0.02, 0.01, 1.5, -2.0])
+    template = deform(image, p, model.Affine())
+
+    image = register.RegisterData(image)
+    template = register.RegisterData(template)
+
+    step, _search = register.Register().register(image, template, model.Affine())
+
+    for spacing in [7, 32, 1000]:
+        coarseStep, _search = register.Register(gridSpacing=spacing).register(
+            image,
+            template,
+            model.Affine()
+            )
+
+        assert np.allclose(step.p, coarseStep.p), \
+            "Spacing: {} estimated p: {} not equal to p: {}".format(
+                spacing,
+                coarseStep.p,
+                step.p
+                )
+
+
+def test_logged_parameters(caplog):
+    """
+    Tests that each logged step holds the parameters of that iteration, not
+    the final parameters.
+    """
+
+    image = nd.gaussian_filter(np.random.RandomState(0).rand(100, 140), 2.0)
+    template = deform(image, np.array([1.5, -2.0]), model.Shift())
+
+    image = register.RegisterData(image)
+    template = register.RegisterData(template)
+
+    with caplog.at_level(logging.DEBUG, logger='imreg.register'):
+        step, _search = register.Register().register(
+            image,
+            template,
+            model.Shift()
+            )
+
+    parameters = [
+        record.args[1] for record in caplog.records
+        if record.msg == register.REGISTRATION_STEP
+        ]
+
+    assert np.allclose(parameters[0], model.Shift().identity)
+    assert not np.allclose(parameters[0], parameters[-1])
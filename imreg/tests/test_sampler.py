@@ -0,0 +1,46 @@
+import numpy as np
+
+import scipy.ndimage as nd
+
+from imreg import model, sampler
+
+
+def test_bilinear_transform():
+    """
+    Tests sampling a linear deformation on-the-fly against sampling its warp,
+    for a non-square image and grid with a non-zero origin.
+    """
+
+    image = np.random.RandomState(0).rand(40, 60)
+
+    coords = model.Coordinates([2, 32, 3, 53])
+
+    tform = model.Affine()
+    p = np.array([0.02, -0.01, 0.03, 0.01, 1.5, -0.5])
+
+    warped = sampler.bilinear(image, tform.transform(p, coords))
+
+    assert np.allclose(
+        sampler.bilinearTransform(image, tform.matrix(p), coords),
+        warped
+        )
+
+
+def test_non_square():
+    """
+    Tests sampling a non-square image.
+    """
+
+    rng = np.random.RandomState(0)
+
+    image = rng.rand(30, 50)
+    warp = np.array([rng.rand(20, 40) * 29, rng.rand(20, 40) * 49])
+
+    assert np.allclose(
+        sampler.bilinear(image, warp),
+        nd.map_coordinates(image, warp, order=1)
+        )
+    assert np.allclose(
+        sampler.nearest(image, warp),
+        nd.map_coordinates(image, warp, order=0)
+        )
@@ -1,6 +1,8 @@
 #! /usr/bin/env python
 
 """ imreg package configuration """
+import sys
+
 import numpy
 import imreg
 
@@ -22,6 +24,17 @@ DOWNLOAD_URL = ''
 
 VERSION = imreg.__version__
 
+# The sampling kernels are parallelised with OpenMP, where it is available.
+if sys.platform == 'win32':
+    OPENMP_ARGS = ['/openmp']
+    OPENMP_LINK_ARGS = []
+elif sys.platform.startswith('linux'):
+    OPENMP_ARGS = ['-fopenmp']
+    OPENMP_LINK_ARGS = ['-fopenmp']
+else:
+    OPENMP_ARGS = []
+    OPENMP_LINK_ARGS = []
+
 CLASSIFIERS = [
     'Development Status :: 4 - Beta',
     'Environment :: Console',
@@ -46,7 +59,14 @@ setup(
     cmdclass={
             'build_ext': build_ext
         },
-    ext_modules=[Extension("imreg.interpolation", ["imreg/_interpolation.pyx"], )],
+    ext_modules=[
+        Extension(
+            "imreg.interpolation",
+            ["imreg/_interpolation.pyx"],
+            extra_compile_args=OPENMP_ARGS,
+            extra_link_args=OPENMP_LINK_ARGS
+            )
+        ],
     include_dirs=[numpy.get_include(), ],
     package_data={},
     install_requires=[